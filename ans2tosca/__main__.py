@@ -4,14 +4,16 @@ Analyzes an Ansible playbook and reports the types of all variables found.
 Can also generate TOSCA data type definitions.
 """
 
+import os
 import sys
 import argparse
-from pathlib import Path
+from functools import lru_cache
 
-import ans2tosca.playbook as playbook
-import ans2tosca.tosca as tosca
+# Translation table that maps word separators in file names to spaces
+_SEPARATORS_TO_SPACES = str.maketrans('_-.', '   ')
 
 
+@lru_cache(maxsize=1024)
 def playbook_name_to_camel_case(playbook_path):
     """
     Convert a playbook filename to CamelCase.
@@ -22,21 +24,21 @@ def playbook_name_to_camel_case(playbook_path):
     - "setup_database.yml" -> "SetupDatabase"
     - "my_playbook" -> "MyPlaybook"
     
+    Results are cached per path, so playbook_path must be hashable.
+    
     Args:
         playbook_path: Path to the playbook file (can include directory)
     
     Returns:
         CamelCase string suitable for a node type name
     """
-    # Extract just the filename without path
-    filename = Path(playbook_path).name
-    
-    # Remove file extension (.yml, .yaml, etc.)
-    name_without_ext = Path(filename).stem
+    # Extract just the filename without path and remove the file
+    # extension (.yml, .yaml, etc.)
+    name_without_ext = os.path.splitext(os.path.basename(playbook_path))[0]
     
     # Replace common separators with spaces
     # Handle: underscores, hyphens, dots
-    normalized = name_without_ext.replace('_', ' ').replace('-', ' ').replace('.', ' ')
+    normalized = name_without_ext.translate(_SEPARATORS_TO_SPACES)
     
     # Split into words and capitalize each
     words = normalized.split()
@@ -72,17 +74,25 @@ def main():
         # Auto-generate from playbook filename
         node_type_name = playbook_name_to_camel_case(args.playbook)    
 
+    # Import the converters only once the arguments are known to be
+    # valid, so --help and usage errors do not pay for loading YAML
+    from ans2tosca import playbook, tosca
+
     # Extract variables defined in the playbook
     variables = playbook.process_playbook(args.playbook)
 
     # Create TOSCA
-    tosca_output = tosca.create_tosca_file(variables, args.playbook, node_type_name)
+    tosca_document = tosca.create_tosca_document(variables, args.playbook, node_type_name)
 
+    # Only open the output once the document is complete, so a failed
+    # run does not truncate an existing file; the YAML is then written
+    # straight to it
     if args.output:
-        with open(args.output, 'w') as f:
-            f.write(tosca_output)
+        with open(args.output, 'w', buffering=1 << 20) as f:
+            tosca.dump_tosca_document(tosca_document, f)
     else:
-        print(tosca_output)
+        tosca.dump_tosca_document(tosca_document, sys.stdout)
+        sys.stdout.write('\n')
 
 if __name__ == "__main__":
     main()
@@ -1,5 +1,21 @@
+import sys
 import yaml
 import re
+from functools import lru_cache
+
+# Use the libyaml based loader when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as _Loader
+except ImportError:
+    from yaml import SafeLoader as _Loader
+
+# Matches {{ ... | default(...) }} and captures the (optional) quote
+# character and the default value
+_JINJA_DEFAULT_RE = re.compile(r'\{\{\s*[^|]+\|\s*default\s*\(\s*([\'"]?)(.+?)\1\s*\)\s*\}\}')
+
+# Matches simple variable references like {{ var_name }}
+_JINJA_VAR_RE = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
 
 def extract_jinja2_default(value):
     """
@@ -15,9 +31,26 @@ def extract_jinja2_default(value):
     if not isinstance(value, str):
         return False, value, None
     
-    # Pattern to match {{ ... | default(...) }}
-    pattern = r'\{\{\s*[^|]+\|\s*default\s*\(\s*([\'"]?)(.+?)\1\s*\)\s*\}\}'
-    match = re.search(pattern, value)
+    # Plain strings cannot contain a Jinja2 expression
+    if '{{' not in value:
+        return False, value, None
+    
+    return _parse_jinja2_default(value)
+
+
+@lru_cache(maxsize=4096)
+def _parse_jinja2_default(value):
+    """
+    Parse a Jinja2 expression string for extract_jinja2_default().
+    Results only contain immutable values, so they are cached: playbooks
+    tend to repeat the same expressions.
+    """
+    # A default filter needs both a '|' and the word 'default'
+    if '|' not in value or 'default' not in value:
+        return False, value, None
+    
+    # Match {{ ... | default(...) }}
+    match = _JINJA_DEFAULT_RE.search(value)
     
     if match:
         quote = match.group(1)
@@ -83,55 +116,96 @@ def convert_jinja2_to_tosca(value, use_get_property=False):
     if not isinstance(value, str):
         return False, value
     
+    # Plain strings cannot contain a Jinja2 expression
+    if '{{' not in value:
+        return False, value
+    
     # Check if string contains Jinja2 variable references (but not default filters)
-    jinja_pattern = r'\{\{\s*(\w+)\s*\}\}'
-    matches = list(re.finditer(jinja_pattern, value))
+    parts = _split_jinja2_references(value)
     
-    if not matches:
+    if parts is None:
         return False, value
     
-    # If the entire string is just a single variable reference, use get_input/get_property directly
-    if len(matches) == 1 and matches[0].group(0) == value.strip():
-        var_name = matches[0].group(1)
-        if use_get_property:
-            return True, {'$get_property': ['SELF', var_name]}
-        else:
-            return True, {'$get_input': var_name}
-    
-    # Build concat parts
+    return True, _references_to_tosca(parts, use_get_property)
+
+
+def _references_to_tosca(parts, use_get_property):
+    """
+    Build the TOSCA function for the (is_variable, text) pairs returned by
+    _split_jinja2_references().
+    """
+    # Build concat parts, using get_input or get_property for the variables
     concat_parts = []
-    last_end = 0
-    
-    for match in matches:
-        start = match.start()
-        end = match.end()
-        var_name = match.group(1)
-        
-        # Add literal string before this variable
-        if start > last_end:
-            literal = value[last_end:start]
-            if literal:
-                concat_parts.append(literal)
-        
-        # Add get_input or get_property for the variable
-        if use_get_property:
-            concat_parts.append({'$get_property': ['SELF', var_name]})
+    for is_variable, text in parts:
+        if not is_variable:
+            concat_parts.append(text)
+        elif use_get_property:
+            concat_parts.append({'$get_property': ['SELF', text]})
         else:
-            concat_parts.append({'$get_input': var_name})
-        
-        last_end = end
-    
-    # Add any remaining literal string
-    if last_end < len(value):
-        literal = value[last_end:]
-        if literal:
-            concat_parts.append(literal)
+            concat_parts.append({'$get_input': text})
     
-    # Return concat function
+    # A single variable reference is used directly, anything else
+    # becomes a concat function
     if len(concat_parts) == 1:
-        return True, concat_parts[0]
+        return concat_parts[0]
     else:
-        return True, {'$concat': concat_parts}
+        return {'$concat': concat_parts}
+
+
+@lru_cache(maxsize=4096)
+def _split_jinja2_references(value):
+    """
+    Split a string into literal text and variable references for
+    convert_jinja2_to_tosca(). Returns a tuple of (is_variable, text)
+    pairs, or None if the string has no variable references. The TOSCA
+    function dicts are built by the caller so cached results stay
+    immutable.
+    """
+    # Splitting on the pattern alternates literal text and the captured
+    # variable names: [literal, name, literal, name, ..., literal]
+    pieces = _JINJA_VAR_RE.split(value)
+    
+    if len(pieces) == 1:
+        return None
+    
+    # If the entire string is just a single variable reference, ignore
+    # any surrounding whitespace
+    if len(pieces) == 3 and not pieces[0].strip() and not pieces[2].strip():
+        return ((True, pieces[1]),)
+    
+    # Odd positions hold variable names; empty literals are dropped
+    parts = []
+    for index, text in enumerate(pieces):
+        if index % 2:
+            parts.append((True, text))
+        elif text:
+            parts.append((False, text))
+    
+    return tuple(parts)
+
+
+def convert_jinja2_value(value):
+    """
+    Convert a playbook variable value for use in TOSCA:
+    - a Jinja2 default filter is replaced by its default value
+    - variable references become $get_input/$concat functions
+    - anything else is returned unchanged
+    
+    Combines extract_jinja2_default and convert_jinja2_to_tosca so that
+    each value is only checked for Jinja2 expressions once.
+    """
+    if not isinstance(value, str) or '{{' not in value:
+        return value
+    
+    has_default, default_value, inferred_type = _parse_jinja2_default(value)
+    if has_default:
+        return default_value
+    
+    parts = _split_jinja2_references(value)
+    if parts is None:
+        return value
+    
+    return _references_to_tosca(parts, False)
 
 
 def extract_vars_from_playbook(playbook_data):
@@ -148,51 +222,33 @@ def extract_vars_from_playbook(playbook_data):
         # Extract vars section
         if 'vars' in play:
             for var_name, var_value in play['vars'].items():
-                # First check if it's a Jinja2 default expression
-                has_default, extracted_value, inferred_type = extract_jinja2_default(var_value)
-                if has_default:
-                    variables[f"vars.{var_name}"] = extracted_value
-                else:
-                    # Check if it contains variable references that need TOSCA conversion
-                    converted, tosca_value = convert_jinja2_to_tosca(var_value)
-                    variables[f"vars.{var_name}"] = tosca_value
+                # Use Jinja2 defaults and convert variable references
+                variables[f"vars.{var_name}"] = convert_jinja2_value(var_value)
         
         # Extract vars_files references
         if 'vars_files' in play:
             for vars_file in play['vars_files']:
                 variables[f"vars_files.{vars_file}"] = f"<external file: {vars_file}>"
         
-        # Extract register variables from tasks
-        if 'tasks' in play:
-            for task in play['tasks']:
-                if isinstance(task, dict) and 'register' in task:
+        # Extract register and set_fact variables from all task lists
+        # in a single pass
+        for section in ('tasks', 'pre_tasks', 'post_tasks'):
+            for task in play.get(section) or ():
+                if not isinstance(task, dict):
+                    continue
+                
+                if 'register' in task:
                     reg_var = task['register']
-                    task_name = task.get('name', 'unnamed task')
-                    variables[f"register.{reg_var}"] = f"<registered from: {task_name}>"
+                    if section == 'tasks':
+                        task_name = task.get('name', 'unnamed task')
+                        variables[f"register.{reg_var}"] = f"<registered from: {task_name}>"
+                    else:
+                        variables[f"register.{reg_var}"] = f"<registered from {section}>"
                 
-                # Extract set_fact variables
-                if isinstance(task, dict) and 'set_fact' in task:
+                # Extract set_fact variables (main tasks only)
+                if section == 'tasks' and 'set_fact' in task:
                     for fact_name, fact_value in task['set_fact'].items():
-                        has_default, extracted_value, inferred_type = extract_jinja2_default(fact_value)
-                        if has_default:
-                            variables[f"set_fact.{fact_name}"] = extracted_value
-                        else:
-                            converted, tosca_value = convert_jinja2_to_tosca(fact_value)
-                            variables[f"set_fact.{fact_name}"] = tosca_value
-        
-        # Extract pre_tasks
-        if 'pre_tasks' in play:
-            for task in play['pre_tasks']:
-                if isinstance(task, dict) and 'register' in task:
-                    reg_var = task['register']
-                    variables[f"register.{reg_var}"] = "<registered from pre_tasks>"
-        
-        # Extract post_tasks
-        if 'post_tasks' in play:
-            for task in play['post_tasks']:
-                if isinstance(task, dict) and 'register' in task:
-                    reg_var = task['register']
-                    variables[f"register.{reg_var}"] = "<registered from post_tasks>"
+                        variables[f"set_fact.{fact_name}"] = convert_jinja2_value(fact_value)
     
     return variables
 
@@ -200,8 +256,9 @@ def extract_vars_from_playbook(playbook_data):
 def process_playbook(filepath):
     """Process a playbook file and return variable types."""
     try:
-        with open(filepath, 'r') as f:
-            playbook_data = yaml.safe_load(f)
+        # Read bytes and let the YAML loader handle decoding
+        with open(filepath, 'rb') as f:
+            playbook_data = yaml.load(f, Loader=_Loader)
         
         variables = extract_vars_from_playbook(playbook_data)
         return variables
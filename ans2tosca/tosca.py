@@ -1,22 +1,42 @@
-from collections import defaultdict
+import re
 import yaml
 
+# Use the libyaml based emitter when PyYAML was built with it
+try:
+    from yaml import CSafeDumper as _Dumper
+except ImportError:
+    from yaml import SafeDumper as _Dumper
+
+# Separators between the components of a variable path such as
+# "vars.users[0].name"
+_PATH_SEPARATORS_RE = re.compile(r'[.\[\]]+')
+
+# TOSCA types for the Python types produced by the YAML loader. Lookups
+# use the exact type first, so bool maps to boolean rather than integer.
+_TOSCA_TYPES = {
+    bool: "boolean",
+    int: "integer",
+    float: "float",
+    str: "string",
+    list: "list",
+    dict: "map",
+}
+
+
 def get_tosca_type(value):
     """Convert Python type to TOSCA type."""
-    if isinstance(value, bool):
-        return "boolean"
-    elif isinstance(value, int):
-        return "integer"
-    elif isinstance(value, float):
-        return "float"
-    elif isinstance(value, str):
-        return "string"
-    elif isinstance(value, list):
-        return "list"
-    elif isinstance(value, dict):
-        return "map"
-    else:
-        return "string"  # default fallback
+    value_type = type(value)
+    tosca_type = _TOSCA_TYPES.get(value_type)
+    if tosca_type is not None:
+        return tosca_type
+    
+    # Subclasses (e.g. OrderedDict) map like their nearest known base
+    for base in value_type.__mro__[1:]:
+        tosca_type = _TOSCA_TYPES.get(base)
+        if tosca_type is not None:
+            return tosca_type
+    
+    return "string"  # default fallback
 
 
 def build_tosca_structure(variables):
@@ -28,92 +48,94 @@ def build_tosca_structure(variables):
     type_definitions = {}
     
     # Group variables by their parent path
-    path_groups = defaultdict(dict)
+    path_groups = {}
     
     for var_path, var_value in variables.items():
         # Skip registered variables and external files
-        if var_path.startswith('register.') or var_path.startswith('vars_files.'):
+        if var_path.startswith(('register.', 'vars_files.')):
+            continue
+        
+        # Plain names need no parsing
+        if '.' not in var_path and '[' not in var_path and ']' not in var_path:
+            path_groups.setdefault('__root__', {})[var_path] = var_value
             continue
         
         # Parse the path
-        parts = var_path.replace('[', '.').replace(']', '').split('.')
+        parts = [part for part in _PATH_SEPARATORS_RE.split(var_path) if part]
         
         # Build nested structure
         if len(parts) == 1:
             # Top-level variable
-            path_groups['__root__'][parts[0]] = var_value
+            path_groups.setdefault('__root__', {})[parts[0]] = var_value
         else:
             # Nested variable - group by parent
             parent_path = '.'.join(parts[:-1])
             field_name = parts[-1]
-            path_groups[parent_path][field_name] = var_value
+            path_groups.setdefault(parent_path, {})[field_name] = var_value
     
     return path_groups
 
 
 def infer_list_entry_type(lst):
     """Infer the type of list entries."""
-    if not lst or len(lst) == 0:
+    if not lst:
         return "string"  # default
     
-    first_item = lst[0]
-    if isinstance(first_item, dict):
-        return "map"
-    elif isinstance(first_item, list):
-        return "list"
-    else:
-        return get_tosca_type(first_item)
+    # Entries are typed after the first one (dicts map to "map" and
+    # lists to "list", like any other value)
+    return get_tosca_type(lst[0])
 
 
-def generate_tosca_data_types(variables, base_name="AnsibleData"):
+def _get_type_name(type_counter, base, suffix=""):
+    """Generate unique type names, counting uses in type_counter."""
+    key = base + suffix if suffix else base
+    count = type_counter.get(key)
+    if count is None:
+        # First use of this name
+        type_counter[key] = 0
+        return key
+    count += 1
+    type_counter[key] = count
+    return f"{key}_{count}"
+
+
+def _process_dict_to_tosca(tosca_types, type_counter, fields, type_name):
     """
-    Generate TOSCA data type definitions from Ansible variables.
+    Convert a dictionary of fields to a TOSCA type definition and add
+    it, along with the types for any nested dictionaries, to
+    tosca_types. Nested dictionaries are handled with an explicit
+    stack; a type is added once all of its fields are done, so nested
+    types come before the types that use them.
     """
-    # Build the structure
-    path_groups = build_tosca_structure(variables)
-    
-    # Generate TOSCA types
-    tosca_types = {}
-    type_counter = {}
+    stack = [(type_name, iter(fields.items()), {})]
     
-    def get_type_name(base, suffix=""):
-        """Generate unique type names."""
-        key = f"{base}{suffix}"
-        if key not in type_counter:
-            type_counter[key] = 0
-            return key
-        else:
-            type_counter[key] += 1
-            return f"{key}_{type_counter[key]}"
-    
-    def process_dict_to_tosca(fields, type_name_base):
-        """Convert a dictionary of fields to a TOSCA type definition."""
-        properties = {}
+    while stack:
+        type_name_base, field_items, properties = stack[-1]
         
-        for field_name, field_value in fields.items():
+        for field_name, field_value in field_items:
             if isinstance(field_value, dict):
                 # Nested dictionary - create a custom type
-                nested_type_name = get_type_name(type_name_base, f".{field_name}".replace('.', '_'))
-                nested_def = process_dict_to_tosca(field_value, nested_type_name)
-                tosca_types[nested_type_name] = nested_def
+                nested_type_name = _get_type_name(type_counter, type_name_base, '_' + str(field_name).replace('.', '_'))
                 
                 properties[field_name] = {
                     'type': nested_type_name,
                     'default': field_value  # Include default value
                 }
+                stack.append((nested_type_name, iter(field_value.items()), {}))
+                break
             elif isinstance(field_value, list):
                 # List type
                 if field_value and isinstance(field_value[0], dict):
                     # List of objects - create custom type
-                    list_item_type = get_type_name(type_name_base, f".{field_name}_item".replace('.', '_'))
-                    item_def = process_dict_to_tosca(field_value[0], list_item_type)
-                    tosca_types[list_item_type] = item_def
+                    list_item_type = _get_type_name(type_counter, type_name_base, '_' + str(field_name).replace('.', '_') + '_item')
                     
                     properties[field_name] = {
                         'type': 'list',
                         'entry_schema': {'type': list_item_type},
                         'default': field_value  # Include default value
                     }
+                    stack.append((list_item_type, iter(field_value[0].items()), {}))
+                    break
                 else:
                     # List of primitives
                     entry_type = infer_list_entry_type(field_value)
@@ -128,23 +150,54 @@ def generate_tosca_data_types(variables, base_name="AnsibleData"):
                     'type': get_tosca_type(field_value),
                     'default': field_value  # Include default value
                 }
-        
-        return {
-            'properties': properties
-        }
+        else:
+            # All fields done
+            stack.pop()
+            tosca_types[type_name_base] = {
+                'properties': properties
+            }
+
+
+def generate_tosca_data_types(variables, base_name="AnsibleData"):
+    """
+    Generate TOSCA data type definitions from Ansible variables.
+    """
+    # Build the structure
+    path_groups = build_tosca_structure(variables)
+    
+    # Generate TOSCA types
+    tosca_types = {}
+    type_counter = {}
     
     # Process top-level variables
     for var_name, var_value in path_groups.get('__root__', {}).items():
         if isinstance(var_value, dict):
-            type_name = get_type_name(base_name, f"_{var_name}")
-            tosca_types[type_name] = process_dict_to_tosca(var_value, type_name)
+            type_name = _get_type_name(type_counter, base_name, f"_{var_name}")
+            _process_dict_to_tosca(tosca_types, type_counter, var_value, type_name)
         elif isinstance(var_value, list) and var_value and isinstance(var_value[0], dict):
-            type_name = get_type_name(base_name, f"_{var_name}_item")
-            tosca_types[type_name] = process_dict_to_tosca(var_value[0], type_name)
+            type_name = _get_type_name(type_counter, base_name, f"_{var_name}_item")
+            _process_dict_to_tosca(tosca_types, type_counter, var_value[0], type_name)
     
     return tosca_types
 
 
+def _top_level_vars(variables):
+    """
+    Return the top-level play vars keyed by name without the 'vars.'
+    prefix. Registered variables, external files and nested fields are
+    left out.
+    """
+    top_level = {}
+    for var_name, var_value in variables.items():
+        if not var_name.startswith('vars.'):
+            continue
+        name = var_name[5:]
+        if '.' in name or '[' in name:
+            continue
+        top_level[name] = var_value
+    return top_level
+
+
 def generate_tosca_node_type(variables, playbook_path):
     """
     Generate TOSCA node type definition from Ansible variables.
@@ -152,22 +205,11 @@ def generate_tosca_node_type(variables, playbook_path):
     """
     properties = {}
     
-    for var_name, var_value in variables.items():
-        # Skip registered variables and external files
-        if var_name.startswith('register.') or var_name.startswith('vars_files.'):
-            continue
-        
-        # Only process top-level vars
-        if not var_name.startswith('vars.'):
-            continue
-        
-        # Remove 'vars.' prefix for property name
-        prop_name = var_name.replace('vars.', '', 1)
-        
-        # Skip if it's a nested field (contains dots after vars.)
-        if '.' in prop_name or '[' in prop_name:
-            continue
-        
+    # Property inputs for the create operation, mapping each property
+    # to a $get_property function
+    operation_inputs = {}
+    
+    for prop_name, var_value in _top_level_vars(variables).items():
         # Determine if property is required based on whether it has a default value
         # Properties with defaults are not required, those without are required
         has_default = var_value is not None
@@ -183,31 +225,28 @@ def generate_tosca_node_type(variables, playbook_path):
         if has_default:
             prop_def['default'] = converted_value
         
-        # For complex types, reference the generated data type
-        if isinstance(converted_value, dict) and not isinstance(converted_value, dict) or (isinstance(converted_value, dict) and '$get_property' not in converted_value and 'concat' not in converted_value):
+        # Set the type and description by kind of value. Dicts other than
+        # TOSCA function calls are complex values that reference the
+        # generated data type
+        if (isinstance(converted_value, dict)
+                and '$get_property' not in converted_value
+                and '$concat' not in converted_value):
             prop_def['type'] = f'AnsibleData_{prop_name}'
-        elif isinstance(converted_value, list) and not isinstance(converted_value, dict):
+            prop_def['description'] = f'Configuration for {prop_name}'
+        elif isinstance(converted_value, list):
+            prop_def['type'] = 'list'
             if converted_value and isinstance(converted_value[0], dict):
-                prop_def['type'] = 'list'
                 prop_def['entry_schema'] = {'type': f'AnsibleData_{prop_name}_item'}
             else:
-                prop_def['type'] = 'list'
                 prop_def['entry_schema'] = {'type': infer_list_entry_type(converted_value)}
-        
-        # Add description based on type
-        if isinstance(converted_value, dict) and 'concat' not in converted_value and '$get_property' not in converted_value:
-            prop_def['description'] = f'Configuration for {prop_name}'
-        elif isinstance(converted_value, list):
             prop_def['description'] = f'List of {prop_name}'
         else:
+            # $concat always evaluates to a string, whatever its arguments
+            if isinstance(converted_value, dict) and '$concat' in converted_value:
+                prop_def['type'] = 'string'
             prop_def['description'] = f'Value for {prop_name}'
-        
+
         properties[prop_name] = prop_def
-    
-    # Generate property inputs for the create operation
-    # Map each property to $get_property function
-    operation_inputs = {}
-    for prop_name in properties.keys():
         operation_inputs[prop_name] = {'$get_property': ['SELF', prop_name]}
     
     # Create the node type definition
@@ -237,30 +276,38 @@ def generate_tosca_node_type(variables, playbook_path):
 
 def convert_get_input_to_get_property(value):
     """
-    Recursively convert get_input references to get_property references.
+    Convert get_input references to get_property references.
     This is needed when converting from inputs (topology template) to properties (node type).
+    Nested dicts and lists (including concat arguments) are walked with an
+    explicit stack instead of recursion, and a converted copy is returned.
+    Containers reached more than once, shared or cyclic, are copied once.
     """
-    if isinstance(value, dict):
-        if '$get_input' in value:
-            # Convert get_input to get_property
-            return {'$get_property': ['SELF', value['$get_input']]}
-        elif 'concat' in value:
-            # Process concat array
-            new_concat = []
-            for item in value['concat']:
-                new_concat.append(convert_get_input_to_get_property(item))
-            return {'concat': new_concat}
-        else:
-            # Recursively process other dicts
-            return {k: convert_get_input_to_get_property(v) for k, v in value.items()}
-    elif isinstance(value, list):
-        return [convert_get_input_to_get_property(item) for item in value]
-    else:
-        return value
+    # Keep the value in a one-element holder so the top-level value can be
+    # replaced the same way as any nested container entry
+    result = [value]
+    stack = [(result, 0)]
+    # Copies by id() of the original container
+    copies = {}
+    while stack:
+        container, key = stack.pop()
+        item = container[key]
+        if isinstance(item, (dict, list)) and id(item) in copies:
+            container[key] = copies[id(item)]
+        elif isinstance(item, dict):
+            if '$get_input' in item:
+                # Convert get_input to get_property
+                container[key] = {'$get_property': ['SELF', item['$get_input']]}
+            else:
+                copies[id(item)] = container[key] = dict(item)
+                stack.extend((container[key], k) for k in item)
+        elif isinstance(item, list):
+            copies[id(item)] = container[key] = list(item)
+            stack.extend((container[key], i) for i in range(len(item)))
+    return result[0]
 
 
-def format_tosca_output(tosca_types, tosca_node_type=None, node_type_name="AnsibleNode"):
-    """Format TOSCA types and node type as YAML string."""
+def build_tosca_document(tosca_types, tosca_node_type=None, node_type_name="AnsibleNode"):
+    """Assemble TOSCA types and node type into a TOSCA document."""
     tosca_document = {
         'tosca_definitions_version': 'tosca_2_0',
         'description': 'TOSCA node type wrapper for Ansible playbook'
@@ -274,10 +321,42 @@ def format_tosca_output(tosca_types, tosca_node_type=None, node_type_name="Ansib
             node_type_name: tosca_node_type
         }
     
-    return yaml.dump(tosca_document, default_flow_style=False, sort_keys=False, width=120)
+    return tosca_document
+
 
+def dump_tosca_document(tosca_document, stream=None):
+    """
+    Format a TOSCA document as YAML. The YAML is written to stream if one
+    is given, otherwise it is returned as a string.
+    """
+    return yaml.dump(tosca_document, stream, Dumper=_Dumper, default_flow_style=False, sort_keys=False, width=120)
+
+
+def format_tosca_output(tosca_types, tosca_node_type=None, node_type_name="AnsibleNode", stream=None):
+    """
+    Format TOSCA types and node type as YAML. The YAML is written to
+    stream if one is given, otherwise it is returned as a string.
+    """
+    tosca_document = build_tosca_document(tosca_types, tosca_node_type, node_type_name)
+    return dump_tosca_document(tosca_document, stream)
 
-def create_tosca_file(variables, playbook_path, node_type_name):
+
+def filter_template_variables(variables):
+    """
+    Remove registered variables and external file references, which do
+    not map to TOSCA definitions.
+    """
+    return {
+        var_path: var_value
+        for var_path, var_value in variables.items()
+        if not var_path.startswith(('register.', 'vars_files.'))
+    }
+
+
+def create_tosca_document(variables, playbook_path, node_type_name):
+
+    # Drop variables that have no TOSCA counterpart
+    variables = filter_template_variables(variables)
 
     # Generate TOSCA data types
     tosca_types = generate_tosca_data_types(variables)
@@ -286,6 +365,11 @@ def create_tosca_file(variables, playbook_path, node_type_name):
     tosca_node_type = generate_tosca_node_type(variables, playbook_path)
 
     # Create TOSCA definitions
-    tosca_output = format_tosca_output(tosca_types, tosca_node_type, node_type_name)
+    return build_tosca_document(tosca_types, tosca_node_type, node_type_name)
+
+
+def create_tosca_file(variables, playbook_path, node_type_name, stream=None):
+
+    tosca_document = create_tosca_document(variables, playbook_path, node_type_name)
 
-    return tosca_output
+    return dump_tosca_document(tosca_document, stream)
@@ -14,9 +14,16 @@ import argparse
 
 # Output
 import os
+import sys
 import json
 import yaml
 
+# Use the libyaml based emitter when PyYAML was built with it
+try:
+    from yaml import CDumper as _Dumper
+except ImportError:
+    from yaml import Dumper as _Dumper
+
 # Core functionality
 import ans2tosca.playbook
 import ans2tosca.json_schema
@@ -40,14 +47,13 @@ def main():
     tosca_yaml = ans2tosca.tosca.convert_playbook_to_tosca(args.playbook, results)
     
     # Write output
-    output = yaml.dump(tosca_yaml, sort_keys=False)
-
     if args.output:
         os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
         with open(args.output, "w", encoding="utf-8") as f:
-            f.write(output)
+            yaml.dump(tosca_yaml, f, Dumper=_Dumper, sort_keys=False)
     else:
-        print(output)
+        yaml.dump(tosca_yaml, sys.stdout, Dumper=_Dumper, sort_keys=False)
+        print()
 
 if __name__ == "__main__":
     main()
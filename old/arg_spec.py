@@ -16,60 +16,74 @@ may fail without required kwargs.
 
 Instead, we run the module in a controlled sandbox that executes the
 module with mocked AnsibleModule (like the pytest-ansible
-strategy). This mocked module patches
+strategy). This mocked module replaces
 
     AnsibleModule.__init__
-    AnsibleModule.exit_json
-    AnsibleModule.fail_json
 
-This will then allow us to call main(), which will populate the merged
-argument_spec.
+which records the merged argument_spec that main() passes to it and
+then stops main() right there, so nothing after the module setup runs.
 """
-import sys
-import os
-import importlib.util
-import types
 
 # ----------------------------
 # Mock class to capture argument_spec
 # ----------------------------
 
+class _Captured(BaseException):
+    """
+    Raised by CaptureArgumentSpec once the spec is captured, to stop
+    main() there. It is a BaseException so that a module's own
+    "except Exception" handlers do not swallow it.
+    """
+
+
 class CaptureArgumentSpec:
+    # Set on the class the module was patched with; extract_argument_spec
+    # patches in a fresh subclass per call so calls do not share state
     captured_spec = None
 
     def __init__(self, argument_spec=None, supports_check_mode=False, *args, **kwargs):
         self.argument_spec = argument_spec or {}
         self.supports_check_mode = supports_check_mode
-        CaptureArgumentSpec.captured_spec = self.argument_spec
-
-    def exit_json(self, **kwargs):
-        pass
-
-    def fail_json(self, **kwargs):
-        pass
+        type(self).captured_spec = self.argument_spec
+        raise _Captured()
 
 # ----------------------------
 # Helpers
 # ----------------------------
 
-def patch_module(module):
-    if hasattr(module, "AnsibleModule"):
-        module.AnsibleModule = CaptureArgumentSpec
-    elif hasattr(module, "AnsibleK8SModule"):
-        module.AnsibleK8SModule = CaptureArgumentSpec
-    elif hasattr(module, "AnsibleAWSModule"):
-        module.AnsibleAWSModule = CaptureArgumentSpec
-    else:
+# Names of the Ansible module classes that get replaced, either directly
+# or through a subclass defined or imported by the module
+_PATCH_BASES = frozenset(("AnsibleModule", "AnsibleK8SModule", "AnsibleAWSModule"))
+
+def patch_module(module, capture_class=CaptureArgumentSpec):
+    namespace = vars(module)
+    patched = False
+    for name, attr in list(namespace.items()):
+        if isinstance(attr, type) and issubclass(attr, CaptureArgumentSpec):
+            # Already patched by an earlier call
+            namespace[name] = capture_class
+            patched = True
+        elif isinstance(attr, type) and any(base.__name__ in _PATCH_BASES for base in attr.__mro__):
+            namespace[name] = capture_class
+            patched = True
+    if not patched:
         print(f"Unable to patch module {str(module)}")
 
 def extract_argument_spec(module):
-    patch_module(module)
+    capture_class = type("CaptureArgumentSpec", (CaptureArgumentSpec,), {"captured_spec": None})
+    patch_module(module, capture_class)
     if hasattr(module, "main"):
         try:
             module.main()
-        except Exception:
+        except _Captured:
+            return capture_class.captured_spec
+        except (Exception, SystemExit):
+            # main() failed or exited before building its module
             pass
-    spec = getattr(CaptureArgumentSpec, "captured_spec", None)
+    # Also set if main() caught _Captured itself. A module-level
+    # argument_spec is only used when main() did not pass one, since it
+    # may lack the args main() merges in
+    spec = capture_class.captured_spec
     if spec is None:
         spec = getattr(module, "argument_spec", {})
     return spec
@@ -10,46 +10,81 @@ JSON_TYPE_MAP = {
     "dict": "object", "mapping": "object",
     "list": "array", "sequence": "array",
     "path": "string",
+    # Types that accept any value get no JSON type
     "raw": None,
     "jsonarg": None,
     "bytes": "string",
 }
 
-def convert_field_to_json_schema(name, opts):
+# Marks options without a default; None is a valid default
+_MISSING = object()
+
+def _convert_field(opts):
+    """
+    Convert a single arg_spec field. Returns the property, the nested
+    options (None if there are none) and whether the field is required.
+    Nested options are not converted here: the returned object property
+    gets an empty "properties" dict and a "required" placeholder, to be
+    filled by the caller.
+    """
     prop = {}
     if not isinstance(opts, dict):
-        return {"description": "UNRESOLVED"}, None
-    ans_type = opts.get("type")
+        return {"description": "UNRESOLVED"}, None, False
+    oget = opts.get
+    ans_type = oget("type")
     json_type = JSON_TYPE_MAP.get(ans_type) if ans_type else "string"
     if json_type:
         prop["type"] = json_type
-    if "choices" in opts:
-        prop["enum"] = list(opts["choices"])
-    if "default" in opts:
-        prop["default"] = opts["default"]
-    if ans_type in ("raw", "jsonarg"):
-        prop.pop("type", None)
+    choices = oget("choices")
+    if choices is not None:
+        prop["enum"] = list(choices)
+    default = oget("default", _MISSING)
+    if default is not _MISSING:
+        prop["default"] = default
     # nested options
-    if "options" in opts and isinstance(opts["options"], dict):
+    options = oget("options")
+    if isinstance(options, dict):
         prop["type"] = "object"
-        nested = convert_arg_spec_to_json_schema(opts["options"])
-        prop["properties"] = nested.get("properties", {})
-        if "required" in nested:
-            prop["required"] = nested["required"]
+        prop["properties"] = {}
+        prop["required"] = None
+    else:
+        options = None
     if ans_type == "list" and "elements" in opts:
-        elem_type = JSON_TYPE_MAP.get(opts["elements"]) if isinstance(opts["elements"], str) else None
+        elements = opts["elements"]
+        elem_type = JSON_TYPE_MAP.get(elements) if isinstance(elements, str) else None
         prop["items"] = {"type": elem_type} if elem_type else {}
-    required_here = [name] if opts.get("required") else None
+    return prop, options, bool(oget("required"))
+
+def _fill_json_schema(schema, arg_spec):
+    # Nested options are handled with an explicit worklist rather than
+    # recursion; properties are filled in place, so key order is kept.
+    # Field names are dict keys, so the required list has no duplicates.
+    stack = [(schema, arg_spec)]
+    while stack:
+        schema, arg_spec = stack.pop()
+        properties = schema["properties"]
+        required_fields = []
+        for k, v in arg_spec.items():
+            prop, options, required = _convert_field(v)
+            properties[k] = prop
+            if options is not None:
+                stack.append((prop, options))
+            if required:
+                required_fields.append(k)
+        if required_fields:
+            schema["required"] = required_fields
+        else:
+            # Drop the placeholder of nested objects
+            schema.pop("required", None)
+
+def convert_field_to_json_schema(name, opts):
+    prop, options, required = _convert_field(opts)
+    if options is not None:
+        _fill_json_schema(prop, options)
+    required_here = [name] if required else None
     return prop, required_here
 
 def convert_arg_spec_to_json_schema(arg_spec):
     schema = {"type": "object", "properties": {}}
-    required_fields = []
-    for k, v in arg_spec.items():
-        prop, req = convert_field_to_json_schema(k, v)
-        schema["properties"][k] = prop
-        if req:
-            required_fields.extend(req)
-    if required_fields:
-        schema["required"] = list(dict.fromkeys(required_fields))
+    _fill_json_schema(schema, arg_spec)
     return schema
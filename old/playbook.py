@@ -5,22 +5,31 @@ Supports both built-in modules and collection modules.
 """
 
 import yaml
+import os
 import sys
 import importlib
 import importlib.util
+from functools import lru_cache
 from pathlib import Path
 
+# Use the libyaml based loader when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as _Loader
+except ImportError:
+    from yaml import SafeLoader as _Loader
 
+
+@lru_cache(maxsize=1)
 def find_collection_paths():
     """
     Find all Ansible collection paths.
+    The paths do not change while running, so they are only looked up
+    once; they are returned as a tuple so the cached value cannot be
+    modified.
     """
     collection_paths = []
     
     try:
-        from ansible import context
-        from ansible.module_utils.common.collections import is_sequence
-        
         # Try to get collection paths from ansible configuration
         try:
             from ansible.utils.collection_loader import AnsibleCollectionConfig
@@ -43,7 +52,21 @@ def find_collection_paths():
     except:
         pass
     
-    return collection_paths
+    return tuple(collection_paths)
+
+
+@lru_cache(maxsize=None)
+def _list_modules(modules_dir):
+    """
+    Return the names of the modules in a collection's plugins/modules
+    directory. Each directory is only read once.
+    """
+    try:
+        with os.scandir(modules_dir) as entries:
+            return frozenset(entry.name[:-3] for entry in entries
+                             if entry.name.endswith('.py') and entry.is_file())
+    except OSError:
+        return frozenset()
 
 
 def load_collection_module(namespace, collection, module_name):
@@ -51,23 +74,26 @@ def load_collection_module(namespace, collection, module_name):
     Load a module from an Ansible collection.
     Example: ansible.builtin.copy -> namespace=ansible, collection=builtin, module=copy
     """
+    # Modules loaded before, here or from the collection paths below
+    module_path = f"ansible_collections.{namespace}.{collection}.plugins.modules.{module_name}"
+    module = sys.modules.get(module_path)
+    if module is not None:
+        return module
+    
     try:
         # Try to import as a Python module
-        module_path = f"ansible_collections.{namespace}.{collection}.plugins.modules.{module_name}"
         return importlib.import_module(module_path)
-    except (ImportError, ModuleNotFoundError):
+    except ImportError:
         pass
     
     # Try to find it in collection paths and load it dynamically
     collection_paths = find_collection_paths()
     for base_path in collection_paths:
-        module_file = Path(base_path) / namespace / collection / 'plugins' / 'modules' / f"{module_name}.py"
-        if module_file.exists():
+        modules_dir = os.path.join(base_path, namespace, collection, 'plugins', 'modules')
+        if module_name in _list_modules(modules_dir):
+            module_file = os.path.join(modules_dir, f"{module_name}.py")
             # Load the module from file path
-            spec = importlib.util.spec_from_file_location(
-                f"ansible_collections.{namespace}.{collection}.plugins.modules.{module_name}",
-                module_file
-            )
+            spec = importlib.util.spec_from_file_location(module_path, module_file)
             if spec and spec.loader:
                 module = importlib.util.module_from_spec(spec)
                 sys.modules[spec.name] = module
@@ -77,31 +103,29 @@ def load_collection_module(namespace, collection, module_name):
     return None
 
 
+@lru_cache(maxsize=1024)
 def load_ansible_module(module_name):
     """
     Load the Python module for an Ansible module.
     Handles both FQCN (Fully Qualified Collection Names) and short names.
     Returns the loaded module object or information about it.
+    Results, including failures, are cached per module name.
     """
     try:
         # Check if it's a FQCN (e.g., ansible.builtin.copy or community.general.docker_container)
-        parts = module_name.split('.')
+        parts = module_name.split('.', 2)
         
-        if len(parts) >= 3:
-            # This is a FQCN: namespace.collection.module_name
-            namespace = parts[0]
-            collection = parts[1]
-            module = '.'.join(parts[2:])  # Handle nested module names
+        if len(parts) == 3:
+            # This is a FQCN: namespace.collection.module_name, where
+            # the module name may itself be nested
+            namespace, collection, module = parts
             
             result = load_collection_module(namespace, collection, module)
             if result:
                 return result
         
         # Try as built-in ansible module first
-        if len(parts) >= 2:
-            simple_name = parts[-1]
-        else:
-            simple_name = module_name
+        simple_name = module_name.rpartition('.')[2]
         
         # Try built-in ansible.builtin collection first
         builtin_result = load_collection_module('ansible', 'builtin', simple_name)
@@ -132,30 +156,56 @@ def load_ansible_module(module_name):
         return f"Error loading module {module_name}: {str(e)}"
 
 
+# Task keys that are not module names
+_SKIP_KEYS = frozenset({'name', 'tags', 'when', 'register', 'become', 'become_user', 
+                        'vars', 'with_items', 'loop', 'notify', 'changed_when', 
+                        'failed_when', 'ignore_errors', 'delegate_to', 'run_once',
+                        'until', 'retries', 'delay', 'environment', 'no_log',
+                        'async', 'poll', 'connection', 'remote_user', 'block',
+                        'rescue', 'always', 'any_errors_fatal', 'max_fail_percentage'})
+
+
 def extract_module_name(task):
     """
     Extract the module name from a task definition.
     """
-    # Skip keys that are not module names
-    skip_keys = {'name', 'tags', 'when', 'register', 'become', 'become_user', 
-                 'vars', 'with_items', 'loop', 'notify', 'changed_when', 
-                 'failed_when', 'ignore_errors', 'delegate_to', 'run_once',
-                 'until', 'retries', 'delay', 'environment', 'no_log',
-                 'async', 'poll', 'connection', 'remote_user', 'block',
-                 'rescue', 'always', 'any_errors_fatal', 'max_fail_percentage'}
-    
+    # Keys are checked in task order, so the first module key wins
     for key in task:
-        if key not in skip_keys:
+        if key not in _SKIP_KEYS:
             return key
     return None
 
 
+def _parse_task_list(results, play_name, tasks, default_name, label):
+    """
+    Append the module of each task in a task list to results. Tasks
+    without a name are called '<default_name> <n>'; the task names are
+    prefixed with label if one is given.
+    """
+    for task_idx, task in enumerate(tasks):
+        module_name = extract_module_name(task)
+        
+        if module_name:
+            if 'name' in task:
+                task_name = task['name']
+            else:
+                task_name = f'{default_name} {task_idx + 1}'
+            loaded_module = load_ansible_module(module_name)
+            results.append({
+                'play': play_name,
+                'task': f"{label} {task_name}" if label else task_name,
+                'module_name': module_name,
+                'loaded_module': loaded_module
+            })
+
+
 def parse_playbook(playbook_path):
     """
     Parse an Ansible playbook and extract tasks with their modules.
     """
-    with open(playbook_path, 'r') as f:
-        playbook = yaml.safe_load(f)
+    # Read bytes and let the YAML loader handle decoding
+    with open(playbook_path, 'rb') as f:
+        playbook = yaml.load(f, Loader=_Loader)
     
     results = []
     
@@ -166,50 +216,9 @@ def parse_playbook(playbook_path):
     for play_idx, play in enumerate(playbook):
         play_name = play.get('name', f'Play {play_idx + 1}')
         
-        # Check for tasks
-        tasks = play.get('tasks', [])
-        
-        for task_idx, task in enumerate(tasks):
-            task_name = task.get('name', f'Task {task_idx + 1}')
-            module_name = extract_module_name(task)
-            
-            if module_name:
-                loaded_module = load_ansible_module(module_name)
-                results.append({
-                    'play': play_name,
-                    'task': task_name,
-                    'module_name': module_name,
-                    'loaded_module': loaded_module
-                })
-        
-        # Check for pre_tasks
-        pre_tasks = play.get('pre_tasks', [])
-        for task_idx, task in enumerate(pre_tasks):
-            task_name = task.get('name', f'Pre-task {task_idx + 1}')
-            module_name = extract_module_name(task)
-            
-            if module_name:
-                loaded_module = load_ansible_module(module_name)
-                results.append({
-                    'play': play_name,
-                    'task': f"[PRE] {task_name}",
-                    'module_name': module_name,
-                    'loaded_module': loaded_module
-                })
-        
-        # Check for post_tasks
-        post_tasks = play.get('post_tasks', [])
-        for task_idx, task in enumerate(post_tasks):
-            task_name = task.get('name', f'Post-task {task_idx + 1}')
-            module_name = extract_module_name(task)
-            
-            if module_name:
-                loaded_module = load_ansible_module(module_name)
-                results.append({
-                    'play': play_name,
-                    'task': f"[POST] {task_name}",
-                    'module_name': module_name,
-                    'loaded_module': loaded_module
-                })
+        # Check for tasks, pre_tasks and post_tasks
+        _parse_task_list(results, play_name, play.get('tasks', []), 'Task', None)
+        _parse_task_list(results, play_name, play.get('pre_tasks', []), 'Pre-task', '[PRE]')
+        _parse_task_list(results, play_name, play.get('post_tasks', []), 'Post-task', '[POST]')
     
     return results
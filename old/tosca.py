@@ -46,29 +46,57 @@ TOSCA_TYPE_MAP = {
     "bytes": "string",
 }
 
-def convert_field_to_tosca(field):
+def _convert_field(field):
+    """
+    Convert a single arg_spec field. Nested options are not converted
+    here: the returned map property gets an empty "properties" dict, to
+    be filled by the caller, together with the options to fill it from
+    (None if there are none).
+    """
     if not isinstance(field, dict):
-        return {"type": "any"}
+        return {"type": "any"}, None
 
-    prop_type = TOSCA_TYPE_MAP.get(field.get("type"), "any")
+    fget = field.get
+    prop_type = TOSCA_TYPE_MAP.get(fget("type"), "any")
     prop = {"type": prop_type}
-    if field.get("required"):
+    if fget("required"):
         prop["required"] = True
     if "default" in field:
         prop["default"] = field["default"]
-    if "choices" in field:
-        prop["validation"] = {"$valid_values": ['$value', list(field["choices"])]}
-    if "options" in field and isinstance(field["options"], dict):
+    choices = fget("choices")
+    if choices is not None:
+        prop["validation"] = {"$valid_values": ['$value', list(choices)]}
+    options = fget("options")
+    if isinstance(options, dict):
         prop["type"] = "map"
-        prop["properties"] = convert_arg_spec_to_tosca(field["options"])
+        prop["properties"] = {}
+    else:
+        options = None
     if prop_type == "list" and "elements" in field:
         prop["entry_schema"] = {"type": TOSCA_TYPE_MAP.get(field["elements"], "any")}
+    return prop, options
+
+def _fill_tosca_properties(tosca_props, arg_spec):
+    # Nested options are handled with an explicit worklist rather than
+    # recursion; properties are filled in place, so key order is kept
+    stack = [(tosca_props, arg_spec)]
+    while stack:
+        tosca_props, arg_spec = stack.pop()
+        for k, v in arg_spec.items():
+            prop, options = _convert_field(v)
+            tosca_props[k] = prop
+            if options is not None:
+                stack.append((prop["properties"], options))
+
+def convert_field_to_tosca(field):
+    prop, options = _convert_field(field)
+    if options is not None:
+        _fill_tosca_properties(prop["properties"], options)
     return prop
 
 def convert_arg_spec_to_tosca(arg_spec):
     tosca_props = {}
-    for k, v in arg_spec.items():
-        tosca_props[k] = convert_field_to_tosca(v)
+    _fill_tosca_properties(tosca_props, arg_spec)
     return tosca_props
 
 def convert_task_to_tosca_type(idx, result):
@@ -89,10 +117,15 @@ def convert_task_to_tosca_type(idx, result):
     
 def convert_playbook_to_tosca(playbook, results):
     
-    node_types = dict()
+    # Tasks using the same module share a node type, which is taken from
+    # the last such task; only that one needs to be converted
+    last_results = dict()
     for idx, result in enumerate(results, 1):
-        node_yaml = convert_task_to_tosca_type(idx, result)
-        node_types[result['module_name']] = node_yaml
+        last_results[result['module_name']] = (idx, result)
+
+    node_types = dict()
+    for module_name, (idx, result) in last_results.items():
+        node_types[module_name] = convert_task_to_tosca_type(idx, result)
 
     tosca_yaml = {
         'tosca_definitions_version': 'tosca_2_0',